@@ -1,43 +1,185 @@
 # --- Start of app.py (Final Version with Anti-Blocking Tweak) ---
-from flask import Flask, render_template, request, send_file, jsonify, after_this_request
+from flask import Flask, render_template, request, send_file, jsonify, after_this_request, Response
 import yt_dlp
 import cv2
-from fpdf import FPDF
-from PIL import Image
+import av
+from av.codec.hwaccel import HWAccel
+import pymupdf
 import os
 import tempfile
 import shutil
 import uuid
 import threading
-import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import re
+from urllib.parse import urlsplit, parse_qs
+import json
+import time
+import redis
+import queue
+import numpy as np
+from numba import njit
 
 app = Flask(__name__)
 
-# A thread-safe dictionary to store the status of our jobs.
-jobs = {}
-jobs_lock = threading.Lock()
+# Jobs run in a process pool so concurrent conversions don't fight over the
+# GIL. Each worker is a full cv2/av/numba interpreter, so the pool size is set
+# per deployment rather than from the host's CPU count. Their status lives in
+# Redis hashes, which the web and worker processes update atomically without
+# sharing a lock, and survives app restarts.
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+executor = None
+executor_lock = threading.Lock()
+redis_client = redis.Redis.from_url(
+    os.environ.get('REDIS_URL', 'redis://localhost:6379/0'), decode_responses=True
+)
+# Finished or abandoned jobs are forgotten after a day
+JOB_TTL = 24 * 60 * 60
+# The web process that queued a job refreshes its heartbeat while the job is
+# queued or running. A job whose heartbeat has gone stale was lost to an app
+# restart and is reported as failed.
+HEARTBEAT_INTERVAL = 10
+JOB_STALE_AFTER = 60
+active_jobs = set()
+heartbeat_thread = None
+
+# Finished PDFs are cached per YouTube video ID and reused until they have
+# gone unused for a week
+PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR', '/var/cache/yt2pdf')
+PDF_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+# Part of every cache entry's name along with VIDEO_MAX_HEIGHT; bump it when
+# a change to the analysis changes which pages a video produces
+PDF_CACHE_VERSION = 'v1'
+
+# Job scratch space (download, PDF) lives in RAM when tmpfs is available
+TEMP_BASE = '/dev/shm' if os.path.exists('/dev/shm') else tempfile.gettempdir()
+
+# Tallest video stream to download. Slides are legible at 480p and pages are
+# capped at A4 width anyway; raise it for sharper pages at the cost of a
+# bigger download and slower decode.
+VIDEO_MAX_HEIGHT = int(os.environ.get('VIDEO_MAX_HEIGHT', 480))
+
+# Optional hardware decoder for PyAV, e.g. "vaapi" or "cuda"; decoding falls
+# back to software when the device can't handle the stream
+VIDEO_HWACCEL = os.environ.get('VIDEO_HWACCEL')
+
+# Run OpenCV's part of the analysis through the T-API (UMat) on an OpenCL
+# device such as an iGPU. Off by default: for thumbnail-sized frames the
+# upload usually costs more than the compute it saves.
+USE_OPENCL = os.environ.get('USE_OPENCL') == '1'
+# Whether an OpenCL device is actually there, probed on first use inside the
+# worker so the web process never initializes an OpenCL runtime
+_opencl_ready = None
+
+# Size of the downscaled frames used for scene change detection
+ANALYSIS_SIZE = (200, 112)
+# Luma histogram bins, and how many sampled frames are scored at once
+HIST_BINS = 64
+BATCH_SIZE = 32
+# Decoded analysis frames buffered ahead of the scoring loop
+PREFETCH_SIZE = 16
+# Samples whose mean luma difference to the last histogrammed sample is
+# below this skip the histogram comparison entirely
+MIN_FRAME_DIFF = 2.0
+# Pages whose dHash is within this many bits of the previous page are dropped
+DUPLICATE_HASH_DISTANCE = 5
+# Pages added to the PDF between incremental saves to disk
+PDF_FLUSH_PAGES = 25
+
+# Patterns for turning video titles into download filenames
+_SAFE_STRIP = re.compile(r'[^\w\s-]')
+_SAFE_DASH = re.compile(r'[-\s]+')
+# Hosts whose watch, shorts, embed and live URLs carry a video ID, besides
+# youtu.be short links
+_YOUTUBE_HOSTS = {'youtube.com', 'www.youtube.com', 'm.youtube.com',
+                  'youtube-nocookie.com', 'www.youtube-nocookie.com'}
+_YOUTUBE_ID = re.compile(r'[\w-]{11}')
 
 # --- Optimized Functions ---
 
+def job_key(job_id):
+    return f"job:{job_id}"
+
+def job_channel(job_id):
+    return f"job-events:{job_id}"
+
+# Checking and writing in one script means a job that expires mid-update
+# isn't recreated as a hash without a TTL
+_UPDATE_JOB = redis_client.register_script("""
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+if ARGV[1] ~= '' then
+    redis.call('PUBLISH', ARGV[1], 'update')
+end
+return 1
+""")
+
+def update_job(job_id, **fields):
+    """
+    Sets fields on a job's status hash, if the job still exists, and pings
+    the job's channel so /events streams push the change to the browser.
+    """
+    args = [job_channel(job_id)]
+    for name, value in fields.items():
+        args += [name, value]
+    _UPDATE_JOB(keys=[job_key(job_id)], args=args)
+
+def update_progress(job_id, **fields):
+    """
+    update_job for progress and stage, which are best-effort: a Redis hiccup
+    mustn't abort the download (yt-dlp doesn't catch hook errors) or the
+    analysis, only leave the bar behind for a moment.
+    """
+    try:
+        update_job(job_id, **fields)
+    except redis.RedisError as e:
+        print(f"[{job_id}] Could not update progress: {e}")
+
+def job_status(job):
+    """The part of a job's status hash that is sent to the browser."""
+    status = job.get('status')
+    if status in ('pending', 'processing') and time.time() - float(job.get('heartbeat', 0)) > JOB_STALE_AFTER:
+        status = 'failed'
+    return {
+        'status': status,
+        'progress': float(job.get('progress', 0)),
+        'stage': job.get('stage'),
+        'filename': job.get('filename')
+    }
+
 def download_video(youtube_url, output_dir, job_id):
     """Downloads video and updates progress using a hook."""
+    last_percent = None
+
     def progress_hook(d):
-        with jobs_lock:
-            if d['status'] == 'downloading' and job_id in jobs:
-                percent_str = d.get('_percent_str', '0%').replace('%','').strip()
-                try:
-                    percent = float(percent_str)
-                    # Download progress is the first 50% of the total progress
-                    jobs[job_id]['progress'] = percent / 2
-                    jobs[job_id]['stage'] = 'Downloading Video'
-                except (ValueError, TypeError):
-                    pass # Ignore if percentage is not a number
+        nonlocal last_percent
+        if d['status'] == 'downloading':
+            percent_str = d.get('_percent_str', '0%').replace('%','').strip()
+            try:
+                percent = float(percent_str)
+            except (ValueError, TypeError):
+                return # Ignore if percentage is not a number
+            # The hook fires for every chunk of every fragment; only whole
+            # percent steps are worth a Redis write
+            if int(percent) == last_percent:
+                return
+            last_percent = int(percent)
+            # Download progress is the first 50% of the total progress
+            update_progress(job_id, progress=percent / 2, stage='Downloading Video')
 
     ydl_opts = {
         'outtmpl': os.path.join(output_dir, 'video.%(ext)s'),
-        'format': 'bestvideo[height<=720][ext=mp4]/best[height<=720][ext=mp4]',
+        'format': f'bestvideo[height<={VIDEO_MAX_HEIGHT}][ext=mp4]/best[height<={VIDEO_MAX_HEIGHT}][ext=mp4]',
         'progress_hooks': [progress_hook],
+        # Fetch DASH/HLS fragments in parallel and in large ranged chunks,
+        # capped so we don't trip YouTube's throttling
+        'concurrent_fragment_downloads': 4,
+        'http_chunk_size': 10 * 1024 * 1024,
+        'ratelimit': 5_000_000,
         # --- FINAL ATTEMPT: Simplify headers and specify source address ---
         'http_headers': {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36',
@@ -56,111 +198,387 @@ def download_video(youtube_url, output_dir, job_id):
             print(f"Error downloading video: {e}")
             return None, None
 
-def frames_to_pdf_generator(video_path, job_id, sampling_rate_fps=1, scene_change_threshold=0.7):
+def prefetch(iterator, maxsize=PREFETCH_SIZE):
+    """
+    Runs an iterator on a background thread and yields its items through a
+    bounded queue, so producing the next items overlaps with consuming these.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterator:
+                if not put((True, item)):
+                    break
+        except Exception as e:
+            put((False, e))
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+            put((False, None))
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            ok, item = items.get()
+            if ok:
+                yield item
+            elif item is None:
+                return
+            else:
+                raise item
+    finally:
+        stop.set()
+        producer.join()
+
+def sample_analysis_frames(container, frame_interval, size=ANALYSIS_SIZE):
+    """
+    Yields (frame_index, small_gray, frame) for every sampled frame of the
+    container's video stream. small_gray is scaled by libswscale straight
+    from the decoded YUV planes; frame is the av.VideoFrame itself, which is
+    only converted to BGR if it ends up as a page.
+    """
+    width, height = size
+    for frame_index, frame in enumerate(container.decode(video=0)):
+        if frame_index % frame_interval:
+            continue
+        small_gray = frame.reformat(width=width, height=height, format='gray8').to_ndarray()
+        yield frame_index, small_gray, frame
+
+def dhash(gray_frame):
+    """64-bit difference hash of a grayscale frame, used to spot repeated pages."""
+    small = cv2.resize(gray_frame, (9, 8), interpolation=cv2.INTER_AREA)
+    return int(np.packbits(small[:, 1:] > small[:, :-1]).view(np.uint64)[0])
+
+def opencl_enabled():
+    """True when USE_OPENCL is set and this process has an OpenCL device."""
+    global _opencl_ready
+    if _opencl_ready is None:
+        _opencl_ready = USE_OPENCL and cv2.ocl.haveOpenCL()
+    return _opencl_ready
+
+def mean_abs_diffs(frames, reference, out=None):
+    """
+    Mean absolute difference between each frame of an (N, H, W) stack and a
+    reference frame. out is an optional (N, H * W) uint8 scratch buffer.
+    """
+    flat = frames.reshape(len(frames), -1)
+    reference = np.broadcast_to(reference.reshape(1, -1), flat.shape)
+    if opencl_enabled():
+        # Difference and average on the OpenCL device, only the per-frame
+        # means come back to the host
+        diff = cv2.absdiff(cv2.UMat(flat), cv2.UMat(reference))
+        return cv2.reduce(diff, 1, cv2.REDUCE_AVG, dtype=cv2.CV_32F).get().ravel()
+    return cv2.absdiff(flat, reference, dst=out).mean(axis=1)
+
+def luma_histograms(frames):
+    """
+    Returns an (N, HIST_BINS) histogram for each frame of an (N, H, W) uint8
+    stack, computed with a single bincount instead of one calcHist per frame.
+    """
+    n = len(frames)
+    # Bin indices go straight into the wider dtype, without a uint8 copy first
+    bins = np.floor_divide(frames.reshape(n, -1), 256 // HIST_BINS, dtype=np.intp)
+    bins += (np.arange(n) * HIST_BINS)[:, None]
+    counts = np.bincount(bins.ravel(), minlength=n * HIST_BINS)
+    return counts.reshape(n, HIST_BINS).astype(np.float32)
+
+@njit(fastmath=True, cache=True)
+def score_batch(hists, threshold):
     """
-    HIGHLY OPTIMIZED: Resizes frames before comparison and updates progress.
+    Flags every histogram row whose cosine similarity with the row before it
+    is below threshold, i.e. a scene change. Returns len(hists) - 1 flags.
+    Unlike correlation this needs no mean, so each pair is a single pass
+    over the bins, and no normalisation since the cosine is scale-invariant.
+    Single-threaded on purpose: it runs once per job process, and a 32x64
+    batch is far cheaper than dispatching it to a thread pool.
     """
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
+    n, bins = hists.shape
+    changes = np.zeros(n - 1, np.bool_)
+    for i in range(1, n):
+        prev = hists[i - 1]
+        cur = hists[i]
+        numerator = 0.0
+        prev_sq = 0.0
+        cur_sq = 0.0
+        for k in range(bins):
+            numerator += prev[k] * cur[k]
+            prev_sq += prev[k] * prev[k]
+            cur_sq += cur[k] * cur[k]
+        denominator = np.sqrt(prev_sq * cur_sq)
+        score = numerator / denominator if denominator > 1e-7 else 1.0
+        changes[i - 1] = score < threshold
+    return changes
+
+def frames_to_pdf_generator(video_path, job_id, sampling_rate_fps=1, scene_change_threshold=0.98):
+    """
+    HIGHLY OPTIMIZED: Decodes once with PyAV, compares downscaled luma
+    frames and only converts the frames we emit to full-quality BGR.
+    """
+    hwaccel = HWAccel(device_type=VIDEO_HWACCEL) if VIDEO_HWACCEL else None
+    try:
+        container = av.open(video_path, hwaccel=hwaccel)
+    except av.FFmpegError:
         print("Error: Could not open video.")
         return
 
-    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    stream = container.streams.video[0]
+    stream.thread_type = 'AUTO' # Multithreaded decode
+    fps = float(stream.average_rate or 30)
     frame_interval = int(fps / sampling_rate_fps) or 1
-
-    last_good_frame = None
+    total_frames = stream.frames
+    if not total_frames:
+        # Fragmented MP4 (how YouTube serves DASH video) has no frame count
+        # in its header, so estimate it from the duration
+        if stream.duration:
+            total_frames = int(float(stream.duration * stream.time_base) * fps)
+        elif container.duration:
+            total_frames = int(container.duration / av.time_base * fps)
+
+    last_emitted_hash = None
+
+    def emit(frame_index, gray_frame, frame):
+        """Returns the page for a finished slide, or None if it repeats the last page."""
+        nonlocal last_emitted_hash
+        page_hash = dhash(gray_frame)
+        if last_emitted_hash is not None and (page_hash ^ last_emitted_hash).bit_count() < DUPLICATE_HASH_DISTANCE:
+            return None
+        last_emitted_hash = page_hash
+        return frame.to_ndarray(format='bgr24')
+
+    last_good = None
     prev_hist = None
-    frame_count = 0
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    compare_size = (200, 112)
-
-    while frame_count < total_frames:
-        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count)
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        with jobs_lock:
-            if job_id in jobs:
-                analysis_progress = (frame_count / total_frames) * 100 if total_frames > 0 else 0
-                # Analysis progress is the second 50% of the total progress
-                jobs[job_id]['progress'] = 50 + (analysis_progress / 2)
-                jobs[job_id]['stage'] = 'Analyzing Video for Slides'
-
-        small_frame = cv2.resize(frame, compare_size)
-        hsv_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2HSV)
-        current_hist = cv2.calcHist([hsv_frame], [0, 1], None, [50, 60], [0, 180, 0, 256])
-        cv2.normalize(current_hist, current_hist, alpha=0, beta=1, norm_type=cv2.NORM_MINMAX)
-
-        if prev_hist is not None:
-            score = cv2.compareHist(prev_hist, current_hist, cv2.HISTCMP_CORREL)
-            if score < scene_change_threshold:
-                if last_good_frame is not None:
-                    yield last_good_frame
-        
-        last_good_frame = frame
-        prev_hist = current_hist
-        frame_count += frame_interval
-
-    if last_good_frame is not None:
-        yield last_good_frame
-
-    cap.release()
+    last_percent = None
+
+    # Reused by every batch instead of stacking new arrays. ref_gray is the
+    # last sample that went through the histogram comparison.
+    width, height = ANALYSIS_SIZE
+    grays = np.empty((BATCH_SIZE, height, width), np.uint8)
+    ref_gray = np.empty((height, width), np.uint8)
+    diff_buf = np.empty((BATCH_SIZE, height * width), np.uint8)
+
+    def process_batch(batch):
+        """Scores a batch of samples in one pass and yields the slides it closes."""
+        nonlocal last_good, prev_hist, last_percent
+        frame_index = batch[-1][0]
+        analysis_progress = (frame_index / total_frames) * 100 if total_frames > 0 else 0
+        # Analysis progress is the second 50% of the total progress, written
+        # only when it moves a whole percent
+        if int(analysis_progress) != last_percent:
+            last_percent = int(analysis_progress)
+            update_progress(job_id, progress=50 + (analysis_progress / 2), stage='Analyzing Video for Slides')
+
+        n = len(batch)
+        current = grays[:n]
+
+        # Most samples of a slide video are near-identical to the last one
+        # that was histogrammed; those keep its histogram and can't be a scene
+        # change, so only the rest go through the histogram comparison.
+        # Gating against that sample rather than the previous one means a
+        # change that creeps in below MIN_FRAME_DIFF per step still adds up.
+        changed = np.zeros(n, np.bool_)
+        start = 0
+        if prev_hist is None:
+            changed[0] = True
+            ref_gray[:] = current[0]
+            start = 1
+        while start < n:
+            diffs = mean_abs_diffs(current[start:], ref_gray, out=diff_buf[:n - start])
+            hits = np.flatnonzero(diffs >= MIN_FRAME_DIFF)
+            if len(hits) == 0:
+                break
+            start += hits[0]
+            changed[start] = True
+            ref_gray[:] = current[start]
+            start += 1
+
+        scene_changes = np.zeros(n, np.bool_)
+        if changed.any():
+            hists = luma_histograms(current[changed])
+            if prev_hist is None:
+                # The very first sample has nothing to be compared against
+                scene_changes[changed] = np.concatenate([[False], score_batch(hists, scene_change_threshold)])
+            else:
+                scene_changes[changed] = score_batch(np.vstack([prev_hist, hists]), scene_change_threshold)
+            prev_hist = hists[-1:]
+
+        for sample, is_change in zip(batch, scene_changes):
+            if is_change and last_good is not None:
+                emitted = emit(*last_good)
+                if emitted is not None:
+                    yield emitted
+            last_good = sample
+
+    # Decoding runs on its own thread, overlapping with scoring and page
+    # encoding on this one.
+    samples = prefetch(sample_analysis_frames(container, frame_interval))
+    try:
+        batch = []
+        for sample in samples:
+            grays[len(batch)] = sample[1]
+            batch.append(sample)
+            if len(batch) == BATCH_SIZE:
+                yield from process_batch(batch)
+                batch = []
+        if batch:
+            yield from process_batch(batch)
+
+        if last_good is not None:
+            emitted = emit(*last_good)
+            if emitted is not None:
+                yield emitted
+    finally:
+        # Stop the decoder thread before the container goes away
+        samples.close()
+        container.close()
+
+def flush_pdf(doc, output_pdf):
+    """
+    Writes the pages added so far to output_pdf and reopens it, so the
+    images already written are read back from disk when needed instead of
+    staying in memory.
+    """
+    if doc.name:
+        doc.saveIncr()
+    else:
+        doc.save(output_pdf)
+    doc.close()
+    return pymupdf.open(output_pdf)
 
 def save_frames_to_pdf(frame_generator, output_pdf):
-    """Robust PDF creation using secure temporary files."""
-    pdf = FPDF('P', 'mm', 'A4')
-    pdf_w = 210
-    margin = 10
+    """
+    Builds the PDF from in-memory JPEG encodes of each frame, saving it to
+    disk every PDF_FLUSH_PAGES pages so only that many page images are held
+    in memory at a time, however long the lecture.
+    """
+    page_w, page_h = pymupdf.paper_size('a4')
+    margin = 10 * 72 / 25.4 # 10 mm in points
     processed_frames = 0
-    
-    for frame in frame_generator:
-        with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as temp_f:
-            temp_img_path = temp_f.name
-        
-        try:
-            is_success = cv2.imwrite(temp_img_path, frame)
+
+    doc = pymupdf.open()
+    try:
+        for frame in frame_generator:
+            # Size comes straight from the array and the JPEG stays in memory,
+            # so there's no tempfile write/read or PIL decode per page.
+            img_h, img_w = frame.shape[:2]
+            is_success, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
             if not is_success:
                 continue
 
-            with Image.open(temp_img_path) as pil_img:
-                img_w, img_h = pil_img.size
-            
             aspect_ratio = img_w / img_h
-            display_w = pdf_w - 2 * margin
+            display_w = page_w - 2 * margin
             display_h = display_w / aspect_ratio
 
-            pdf.add_page()
-            pdf.image(temp_img_path, x=margin, y=margin, w=display_w, h=display_h)
+            page = doc.new_page(width=page_w, height=page_h)
+            # JPEG bytes are embedded as-is (DCTDecode), without re-encoding
+            rect = pymupdf.Rect(margin, margin, margin + display_w, margin + display_h)
+            page.insert_image(rect, stream=jpeg.tobytes())
             processed_frames += 1
-        finally:
-            if os.path.exists(temp_img_path):
-                os.remove(temp_img_path)
+            if processed_frames % PDF_FLUSH_PAGES == 0:
+                doc = flush_pdf(doc, output_pdf)
 
-    if processed_frames > 0:
-        pdf.output(output_pdf)
+        if processed_frames == 0:
+            return False
+        if processed_frames % PDF_FLUSH_PAGES:
+            doc = flush_pdf(doc, output_pdf)
         return True
-    return False
+    finally:
+        doc.close()
+
+# --- PDF Cache ---
+
+def youtube_video_id(youtube_url):
+    """Extracts the 11-character video ID from a YouTube URL, or None."""
+    youtube_url = youtube_url.strip()
+    # Pasted URLs often lack the scheme
+    try:
+        url = urlsplit(youtube_url if '//' in youtube_url else '//' + youtube_url)
+    except ValueError:
+        return None
+    host = url.hostname or ''
+    path = url.path.split('/')
+    candidate = ''
+    if host == 'youtu.be':
+        candidate = path[1]
+    elif host in _YOUTUBE_HOSTS:
+        if url.path == '/watch':
+            candidate = parse_qs(url.query).get('v', [''])[0]
+        elif len(path) > 2 and path[1] in ('shorts', 'embed', 'live', 'v'):
+            candidate = path[2]
+    return candidate if _YOUTUBE_ID.fullmatch(candidate) else None
+
+def cache_path(video_id, ext):
+    """Path of a video's cache entry for the current output settings."""
+    return os.path.join(PDF_CACHE_DIR, f"{video_id}-{VIDEO_MAX_HEIGHT}p-{PDF_CACHE_VERSION}.{ext}")
+
+def cached_pdf(video_id):
+    """
+    Returns (path, filename) of the cached PDF for a video, or None if there
+    is no fresh one. A hit refreshes the entry, so entries only expire once
+    they go unused for PDF_CACHE_MAX_AGE.
+    """
+    pdf_path = cache_path(video_id, 'pdf')
+    try:
+        if time.time() - os.path.getmtime(pdf_path) > PDF_CACHE_MAX_AGE:
+            return None
+        with open(cache_path(video_id, 'json')) as f:
+            filename = json.load(f)['filename']
+        os.utime(pdf_path)
+    except (OSError, ValueError, KeyError):
+        return None
+    return pdf_path, filename
+
+def store_cached_pdf(video_id, output_pdf, filename):
+    """Copies a finished PDF into the cache and prunes expired entries."""
+    try:
+        os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+        # Metadata goes first, so a cached PDF always has its filename
+        with open(cache_path(video_id, 'json'), 'w') as f:
+            json.dump({'filename': filename}, f)
+        pdf_path = cache_path(video_id, 'pdf')
+        partial_path = f"{pdf_path}.{uuid.uuid4().hex}.part"
+        shutil.copyfile(output_pdf, partial_path)
+        os.replace(partial_path, pdf_path)
+
+        now = time.time()
+        for entry in os.scandir(PDF_CACHE_DIR):
+            if entry.name.endswith('.pdf') and now - entry.stat().st_mtime > PDF_CACHE_MAX_AGE:
+                os.remove(entry.path)
+                meta_path = entry.path[:-len('.pdf')] + '.json'
+                if os.path.exists(meta_path):
+                    os.remove(meta_path)
+    except OSError as e:
+        print(f"Could not cache PDF for video {video_id}: {e}")
 
 # --- Background Task Definition ---
 
 def create_pdf_task(youtube_url, job_id):
-    """This function runs in the background thread."""
-    temp_base = '/dev/shm' if os.path.exists('/dev/shm') else tempfile.gettempdir()
-    temp_dir = tempfile.mkdtemp(dir=temp_base)
-    
-    with jobs_lock:
-        jobs[job_id]['status'] = 'processing'
+    """This function runs in a worker process of the executor."""
+    temp_dir = tempfile.mkdtemp(dir=TEMP_BASE)
+    completed = False
     
     try:
+        update_job(job_id, status='processing')
+
         video_path, video_title = download_video(youtube_url, temp_dir, job_id)
         if not video_path:
             raise Exception("Failed to download video.")
             
         frame_gen = frames_to_pdf_generator(video_path, job_id, sampling_rate_fps=1)
         
-        safe_filename = re.sub(r'[^\w\s-]', '', video_title).strip()
-        safe_filename = re.sub(r'[-\s]+', '-', safe_filename) + ".pdf"
+        safe_filename = _SAFE_STRIP.sub('', video_title).strip()
+        safe_filename = _SAFE_DASH.sub('-', safe_filename) + ".pdf"
         if not safe_filename: safe_filename = "video-slides.pdf"
 
         output_pdf = os.path.join(temp_dir, "output.pdf")
@@ -169,20 +587,92 @@ def create_pdf_task(youtube_url, job_id):
         if not success:
             raise Exception("No unique frames found to create PDF.")
 
-        with jobs_lock:
-            if job_id in jobs:
-                jobs[job_id]['status'] = 'complete'
-                jobs[job_id]['filepath'] = output_pdf
-                jobs[job_id]['temp_dir'] = temp_dir
-                jobs[job_id]['filename'] = safe_filename
+        video_id = youtube_video_id(youtube_url)
+        if video_id:
+            store_cached_pdf(video_id, output_pdf, safe_filename)
+
+        update_job(job_id, status='complete', filepath=output_pdf, temp_dir=temp_dir, filename=safe_filename)
+        completed = True
         print(f"[{job_id}] Job complete.")
 
     except Exception as e:
         print(f"[{job_id}] Job failed: {e}")
-        with jobs_lock:
-            if job_id in jobs:
-                jobs[job_id]['status'] = 'failed'
-        shutil.rmtree(temp_dir, ignore_errors=True)
+        try:
+            update_job(job_id, status='failed')
+        except redis.RedisError as redis_error:
+            # The job's heartbeat stops with this task, so it still ends up
+            # reported as failed
+            print(f"[{job_id}] Could not mark job failed: {redis_error}")
+    finally:
+        # Only a completed job's directory is left for /download to clean up
+        if not completed:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def new_executor():
+    # Workers come from a forkserver rather than being forked from this
+    # multithreaded web process with its open Redis connections and streams
+    return ProcessPoolExecutor(
+        max_workers=JOB_WORKERS, mp_context=multiprocessing.get_context('forkserver')
+    )
+
+def discard_executor(pool):
+    """Drops a broken pool so the next submission starts a fresh one."""
+    global executor
+    with executor_lock:
+        if executor is pool:
+            executor = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def heartbeat_loop():
+    """Keeps the heartbeat of every job queued or running in this process fresh."""
+    while True:
+        with executor_lock:
+            job_ids = list(active_jobs)
+        now = time.time()
+        try:
+            for job_id in job_ids:
+                # No channel: a heartbeat isn't worth waking /events streams for
+                _UPDATE_JOB(keys=[job_key(job_id)], args=['', 'heartbeat', now])
+        except redis.RedisError as e:
+            print(f"Could not refresh job heartbeats: {e}")
+        time.sleep(HEARTBEAT_INTERVAL)
+
+def job_finished(job_id, pool, future):
+    """Marks a job failed when its worker died before the task could report back."""
+    with executor_lock:
+        active_jobs.discard(job_id)
+    if future.cancelled() or future.exception() is not None:
+        print(f"[{job_id}] Job lost: worker process did not finish it.")
+        update_job(job_id, status='failed')
+        if isinstance(future.exception(), BrokenProcessPool):
+            discard_executor(pool)
+
+def submit_job(youtube_url, job_id):
+    """
+    Queues a conversion on the process pool. A worker that crashes (OOM kill,
+    native crash) breaks the whole pool and fails every job still in it; the
+    pool is then replaced so later requests keep working.
+    """
+    global executor, heartbeat_thread
+    with executor_lock:
+        if executor is None:
+            executor = new_executor()
+        if heartbeat_thread is None:
+            heartbeat_thread = threading.Thread(target=heartbeat_loop, daemon=True)
+            heartbeat_thread.start()
+        pool = executor
+        try:
+            future = pool.submit(create_pdf_task, youtube_url, job_id)
+        except BrokenProcessPool:
+            # Broke before the done callback of the crashed job got to it
+            print(f"[{job_id}] Job failed: process pool was broken, restarting it.")
+            update_job(job_id, status='failed')
+            executor = None
+            pool.shutdown(wait=False, cancel_futures=True)
+            return
+        active_jobs.add(job_id)
+    future.add_done_callback(lambda f: job_finished(job_id, pool, f))
 
 
 # --- Flask Routes ---
@@ -195,47 +685,79 @@ def index():
 def convert():
     youtube_url = request.form["youtube_url"]
     job_id = str(uuid.uuid4())
+
+    # Videos converted recently are served straight from the cache
+    video_id = youtube_video_id(youtube_url)
+    cached = cached_pdf(video_id) if video_id else None
+    if cached:
+        filepath, filename = cached
+        job = {'status': 'complete', 'progress': 100, 'stage': 'Done', 'filepath': filepath, 'filename': filename}
+    else:
+        job = {'status': 'pending', 'progress': 0, 'stage': 'Initializing', 'heartbeat': time.time()}
     
-    with jobs_lock:
-        jobs[job_id] = {'status': 'pending', 'progress': 0, 'stage': 'Initializing'}
+    with redis_client.pipeline() as pipe:
+        pipe.hset(job_key(job_id), mapping=job)
+        pipe.expire(job_key(job_id), JOB_TTL)
+        pipe.execute()
     
-    thread = threading.Thread(target=create_pdf_task, args=(youtube_url, job_id))
-    thread.start()
+    if not cached:
+        submit_job(youtube_url, job_id)
     
     return jsonify({'job_id': job_id})
 
 @app.route("/status/<job_id>")
 def status(job_id):
-    with jobs_lock:
-        job = jobs.get(job_id, {})
+    job = redis_client.hgetall(job_key(job_id))
     if not job:
         return jsonify({'status': 'not_found'}), 404
-    return jsonify({
-        'status': job.get('status'),
-        'progress': job.get('progress'),
-        'stage': job.get('stage'),
-        'filename': job.get('filename')
-    })
+    return jsonify(job_status(job))
+
+@app.route("/events/<job_id>")
+def events(job_id):
+    """Pushes the job's status as server-sent events until it finishes."""
+    def stream():
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(job_channel(job_id))
+        try:
+            while True:
+                job = redis_client.hgetall(job_key(job_id))
+                if not job:
+                    yield f"data: {json.dumps({'status': 'not_found'})}\n\n"
+                    return
+                current = job_status(job)
+                yield f"data: {json.dumps(current)}\n\n"
+                if current['status'] in ('complete', 'failed'):
+                    return
+
+                # Wait for the next update, then drain any burst of them so
+                # one fresh read covers them all
+                if pubsub.get_message(timeout=15) is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                while pubsub.get_message():
+                    pass
+        finally:
+            pubsub.close()
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
 @app.route("/download/<job_id>")
 def download(job_id):
-    with jobs_lock:
-        job = jobs.get(job_id, None)
+    job = redis_client.hgetall(job_key(job_id))
     
-    if job is None or job.get('status') != 'complete':
+    if not job or job.get('status') != 'complete':
         return "Job not found or not complete.", 404
     
     filepath = job['filepath']
-    temp_dir = job['temp_dir']
+    temp_dir = job.get('temp_dir') # Not set for PDFs served from the cache
     filename = job.get('filename', 'slides.pdf')
 
     @after_this_request
     def cleanup(response):
         try:
-            shutil.rmtree(temp_dir)
-            with jobs_lock:
-                if job_id in jobs:
-                    del jobs[job_id]
+            if temp_dir:
+                shutil.rmtree(temp_dir)
+            redis_client.delete(job_key(job_id))
             print(f"Cleaned up job {job_id}")
         except Exception as e:
             print(f"Error during cleanup for job {job_id}: {e}")